@@ -177,8 +177,15 @@ class PIVlabNoGUIFinal:
             return False
     
     def batch_analyze(self, image_dir, output_dir="final_piv_results", 
-                     max_pairs=None, window_size=64, step_size=32):
-        """批量分析图像对"""
+                     max_pairs=None, window_size=64, step_size=32,
+                     progress_callback=None, cancel_event=None):
+        """
+        批量分析图像对
+        
+        Args:
+            progress_callback: 可选，每处理完一对图像调用 progress_callback(已处理数, 总数, 结果文件或None)
+            cancel_event: 可选threading.Event，置位后在下一对图像开始前停止
+        """
         try:
             print(f"\n🚀 PIVlab无GUI批量分析:")
             print(f"  📁 输入目录: {image_dir}")
@@ -210,22 +217,31 @@ class PIVlabNoGUIFinal:
             # 分析连续的图像对
             successful = 0
             for i in range(max_pairs):
+                if cancel_event is not None and cancel_event.is_set():
+                    print(f"\n⏹️ 批量分析已取消，已处理 {i}/{max_pairs} 对图像")
+                    break
+                
                 filename1 = image_files[i]
                 filename2 = image_files[i + 1]
                 
                 print(f"\n📊 分析第 {i+1}/{max_pairs} 对图像:")
                 
+                saved_file = None
                 if self.analyze_image_pair(image_dir, filename1, filename2, 
                                          window_size, step_size):
                     output_file = os.path.join(output_dir, f"piv_result_{i+1:03d}.txt")
                     if self.save_results(output_file):
                         successful += 1
+                        saved_file = output_file
                         
                         # 显示进度
                         progress = (i + 1) / max_pairs * 100
                         print(f"  📈 进度: {progress:.1f}%")
                 else:
                     print(f"❌ 第 {i+1} 对图像分析失败")
+                
+                if progress_callback is not None:
+                    progress_callback(i + 1, max_pairs, saved_file)
             
             print(f"\n🎉 批量分析完成!")
             print(f"  ✅ 成功处理: {successful}/{max_pairs} 对图像")
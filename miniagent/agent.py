@@ -1,63 +1,139 @@
 # 精简版智能体核心代码
-from llm_client import LLMClient
+import time
+from llm_client import LLMClient, ToolCallStreamParser
 from memory import Memory
 from tools import ToolManager
+from tracing import NullTracer
 
 class Agent:
-    def __init__(self):
-        self.llm = LLMClient()
-        self.memory = Memory()
-        self.tools = ToolManager()
+    def __init__(self, llm=None, memory=None, tools=None, tracer=None, temperature=None):
+        """
+        llm / memory / tools 可从外部传入
+        多会话服务器中每个会话独立一份Memory，LLMClient和ToolManager共享
+        tracer: 可选Tracer，记录每轮对话中构建消息、LLM、解析和工具各阶段的耗时
+        temperature: 采样温度，None时使用LLMClient的默认值
+        """
+        self.llm = llm or LLMClient()
+        self.memory = memory or Memory()
+        self.tools = tools or ToolManager()
+        self.tracer = tracer or NullTracer()
+        self.temperature = temperature
         self.iteration_count = 0
+        # 最近一轮对话的延迟指标（秒）
+        self.metrics = {}
 
-    def chat(self, user_input: str) -> str:
-        """与用户对话的主要方法"""
+    def chat(self, user_input: str, on_token=None) -> str:
+        """
+        与用户对话的主要方法
+        on_token: 可选回调，LLM输出的普通文本会立即传给它
+        """
         self.iteration_count = 0
-        self.memory.add_message("user", user_input)
-        response = self._process_message(user_input)
-        self.memory.add_message("assistant", response)
+        self._turn_start = time.perf_counter()
+        self.metrics = {"time_to_first_token": None, "time_to_tool_start": []}
+        with self.tracer.span("turn", bytes=len(user_input.encode("utf-8"))) as span:
+            self.memory.add_message("user", user_input)
+            response = self._process_message(user_input, on_token)
+            self.memory.add_message("assistant", response)
+            span.set(iterations=self.iteration_count)
+        self.metrics["total_time"] = time.perf_counter() - self._turn_start
         return response
 
-    def _process_message(self, user_input: str) -> str:
+    def _process_message(self, user_input: str, on_token=None) -> str:
         """处理消息的核心逻辑"""
-        messages = self._build_messages(user_input)
-        response = self.llm.chat(messages)
-        tool_call = self.llm.extract_tool_call(response)
-        
+        messages = self._prepare_messages(user_input)
+        response, tool_call = self._stream_response(messages, on_token)
+
         if tool_call:
-            return self._handle_tool_call(response, tool_call, user_input)
+            return self._handle_tool_call(tool_call, user_input, on_token)
         else:
             return response
 
-    def _handle_tool_call(self, response: str, tool_call: dict, original_input: str) -> str:
+    def _handle_tool_call(self, tool_call: dict, original_input: str, on_token=None) -> str:
         """处理工具调用"""
         self.iteration_count += 1
-        
+
         # 防止无限循环
         if self.iteration_count > 5:
+            if on_token:
+                on_token("\n达到最大迭代次数限制")
             return "达到最大迭代次数限制"
-        
+
+        self.metrics["time_to_tool_start"].append(time.perf_counter() - self._turn_start)
         tool_name = tool_call.get("tool_name")
-        tool_result = self.tools.execute_tool(tool_name, tool_call.get("parameters", {}))
-        
+        with self.tracer.span("tool", tool=tool_name) as span:
+            tool_result = self.tools.execute_tool(tool_name, tool_call.get("parameters", {}))
+            span.set(bytes=len(str(tool_result).encode("utf-8")))
+
         # 构建包含工具结果的消息
-        context_messages = self._build_messages(original_input)
+        context_messages = self._prepare_messages(original_input)
         tool_message = f"工具调用：{tool_call}\n工具结果：{tool_result}"
         context_messages.append({"role": "user", "content": tool_message})
-        
+
         # 继续处理
-        next_response = self.llm.chat(context_messages)
-        next_tool_call = self.llm.extract_tool_call(next_response)
-        
+        next_response, next_tool_call = self._stream_response(context_messages, on_token)
+
         if next_tool_call:
-            return self._handle_tool_call(next_response, next_tool_call, original_input)
+            return self._handle_tool_call(next_tool_call, original_input, on_token)
         else:
             return next_response
 
+    def _stream_response(self, messages: list, on_token=None):
+        """
+        流式获取LLM响应
+        普通文本立即转发给on_token，工具调用块一闭合就停止接收并返回
+        返回 (已接收的响应文本, 工具调用或None)
+        """
+        parser = ToolCallStreamParser()
+        chunks = []
+        tool_call = None
+        parse_time = 0.0
+        with self.tracer.span("llm") as span:
+            if self.temperature is None:
+                stream = self.llm.stream_chat(messages)
+            else:
+                stream = self.llm.stream_chat(messages, temperature=self.temperature)
+            try:
+                for chunk in stream:
+                    if self.metrics.get("time_to_first_token") is None:
+                        self.metrics["time_to_first_token"] = time.perf_counter() - self._turn_start
+                    chunks.append(chunk)
+                    parse_start = time.perf_counter()
+                    events = parser.feed(chunk)
+                    parse_time += time.perf_counter() - parse_start
+                    for kind, value in events:
+                        if kind == "tool_call":
+                            tool_call = value
+                            break
+                        if on_token:
+                            on_token(value)
+                    if tool_call is not None:
+                        break
+            finally:
+                stream.close()
+
+            if tool_call is None:
+                for kind, value in parser.close():
+                    if on_token:
+                        on_token(value)
+            response = "".join(chunks)
+            span.set(tokens=len(chunks), bytes=len(response.encode("utf-8")),
+                     tool_call=tool_call is not None)
+            # 解析分散在流式输出过程中，累计后作为llm的子阶段单独记录（llm阶段的耗时包含这部分）
+            self.tracer.record("parse", parse_time)
+        return response, tool_call
+
+    def _prepare_messages(self, user_input: str) -> list:
+        """构建消息并记录该阶段"""
+        with self.tracer.span("build_messages") as span:
+            messages = self._build_messages(user_input)
+            span.set(messages=len(messages),
+                     bytes=sum(len(message["content"].encode("utf-8")) for message in messages))
+        return messages
+
     def _build_messages(self, user_input: str) -> list:
         """构建发送给LLM的消息列表"""
         messages = []
-        
+
         # 系统提示词
         system_message = """你是一个智能助手，具有以下能力：
 1. 规划：能够将复杂任务分解为多个步骤
@@ -73,16 +149,16 @@ class Agent:
 ```
 
 可用工具：
-- get_time: 获取当前时间，无需参数
 """
+        system_message += self.tools.describe_tools() + "\n"
         messages.append({"role": "system", "content": system_message})
-        
+
         # 添加记忆中的上下文
         context_messages = self.memory.get_context_messages()
         messages.extend(context_messages)
-        
+
         # 添加当前用户输入
         if not context_messages or context_messages[-1]["content"] != user_input:
             messages.append({"role": "user", "content": user_input})
-        
-        return messages 
\ No newline at end of file
+
+        return messages
@@ -0,0 +1,182 @@
+# 智能体基准测试：用可配置延迟的脚本化LLM驱动多工具对话，输出各阶段耗时和轮次吞吐
+import sys
+import json
+import time
+import argparse
+import threading
+from agent import Agent
+from memory import Memory
+from tools import ToolManager
+from tracing import Tracer, InMemoryCollector, JsonLinesExporter
+
+# 平均耗时低于此值（秒）的阶段波动太大，不参与退化比较
+NOISE_FLOOR = 0.0001
+
+# 脚本化LLM每轮依次调用的工具
+SCRIPT_TOOLS = [
+    ("bench_lookup", {"key": "flow_rate"}),
+    ("bench_compute", {"n": 20000}),
+]
+
+def tool_call_response(tool_name, parameters):
+    """生成带工具调用代码块的响应"""
+    body = json.dumps({"tool_name": tool_name, "parameters": parameters}, ensure_ascii=False, indent=4)
+    return f"我需要调用{tool_name}。\n```tool_call\n{body}\n```"
+
+def build_script(tools_per_turn: int, answer_length: int):
+    """一轮对话的脚本：先依次调用tools_per_turn个工具，最后给出回答"""
+    script = [tool_call_response(*SCRIPT_TOOLS[i % len(SCRIPT_TOOLS)]) for i in range(tools_per_turn)]
+    script.append("根据工具结果，" + "结论" * (answer_length // 2))
+    return script
+
+
+class ScriptedLLM:
+    """
+    脚本化的模拟LLM
+    按顺序循环返回脚本中的响应，首token延迟和每个token的延迟可配置
+    """
+
+    def __init__(self, script, first_token_latency=0.0, token_latency=0.0, chunk_size=4):
+        self.script = script
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.chunk_size = chunk_size
+        self._index = 0
+
+    def chat(self, messages, temperature=None, max_tokens=1500):
+        return "".join(self.stream_chat(messages, temperature, max_tokens))
+
+    def stream_chat(self, messages, temperature=None, max_tokens=1500):
+        response = self.script[self._index % len(self.script)]
+        self._index += 1
+        if self.first_token_latency:
+            time.sleep(self.first_token_latency)
+        for i in range(0, len(response), self.chunk_size):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield response[i:i + self.chunk_size]
+
+
+def bench_lookup(key: str) -> str:
+    return f"{key} = 42"
+
+def bench_compute(n: int) -> str:
+    total = 0
+    for i in range(n):
+        total += i * i
+    return f"sum = {total}"
+
+def build_tools(tool_latency: float) -> ToolManager:
+    tools = ToolManager()
+    if tool_latency:
+        def lookup(key):
+            time.sleep(tool_latency)
+            return bench_lookup(key)
+    else:
+        lookup = bench_lookup
+    tools.register_tool("bench_lookup", lookup, "基准测试：查表",
+                        {"key": {"type": "string", "required": True}})
+    tools.register_tool("bench_compute", bench_compute, "基准测试：计算",
+                        {"n": {"type": "integer", "required": True}}, mode="thread")
+    return tools
+
+def run_benchmark(turns=200, agents=1, tools_per_turn=2, first_token_latency=0.0,
+                  token_latency=0.0, tool_latency=0.0, answer_length=200, exporters=None):
+    """
+    运行基准测试
+    agents个智能体各自在线程中跑turns轮，共享同一个ToolManager和Tracer
+    返回 {"turns", "elapsed", "turns_per_sec", "stages": 各阶段汇总}
+    """
+    collector = InMemoryCollector()
+    tracer = Tracer([collector] + list(exporters or []))
+    tools = build_tools(tool_latency)
+    script = build_script(tools_per_turn, answer_length)
+
+    def worker(index):
+        llm = ScriptedLLM(script, first_token_latency, token_latency)
+        agent = Agent(llm=llm, memory=Memory(), tools=tools, tracer=tracer)
+        for turn in range(turns):
+            agent.chat(f"第{turn}轮：请分析会话{index}的数据")
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(agents)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    tools.shutdown()
+
+    total_turns = turns * agents
+    return {
+        "turns": total_turns,
+        "elapsed": elapsed,
+        "turns_per_sec": total_turns / elapsed if elapsed else 0.0,
+        "stages": collector.breakdown(),
+    }
+
+def print_report(result):
+    stages = result["stages"]
+    turn_total = stages.get("turn", {}).get("total", 0.0)
+    print(f"轮次：{result['turns']}  耗时：{result['elapsed']:.2f}s  吞吐：{result['turns_per_sec']:.1f} 轮/s")
+    print(f"{'阶段':<16}{'次数':>8}{'总计ms':>12}{'平均ms':>10}{'p50ms':>10}{'p99ms':>10}{'占比':>8}{'tokens':>9}{'bytes':>10}")
+    for name in ("turn", "build_messages", "llm", "parse", "tool"):
+        stage = stages.get(name)
+        if not stage:
+            continue
+        share = stage["total"] / turn_total * 100 if turn_total else 0.0
+        print(f"{name:<16}{stage['count']:>8}{stage['total'] * 1000:>12.1f}{stage['mean'] * 1000:>10.3f}"
+              f"{stage['p50'] * 1000:>10.3f}{stage['p99'] * 1000:>10.3f}{share:>7.1f}%"
+              f"{stage['tokens']:>9}{stage['bytes']:>10}")
+    print("注：llm阶段的耗时包含parse")
+
+def compare_with_baseline(result, baseline, max_regression):
+    """与基线比较，返回退化项列表"""
+    regressions = []
+    if result["turns_per_sec"] < baseline["turns_per_sec"] * (1 - max_regression):
+        regressions.append(f"吞吐 {baseline['turns_per_sec']:.1f} -> {result['turns_per_sec']:.1f} 轮/s")
+    for name, stage in result["stages"].items():
+        base = baseline["stages"].get(name)
+        if base and base["mean"] >= NOISE_FLOOR and stage["mean"] > base["mean"] * (1 + max_regression):
+            regressions.append(f"{name} 平均耗时 {base['mean'] * 1000:.3f} -> {stage['mean'] * 1000:.3f}ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="智能体基准测试")
+    parser.add_argument("--turns", type=int, default=200, help="每个智能体的轮数")
+    parser.add_argument("--agents", type=int, default=1, help="并发的智能体数")
+    parser.add_argument("--tools-per-turn", type=int, default=2, help="每轮调用的工具数（不超过5）")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="LLM首token延迟（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="每个token的延迟（秒）")
+    parser.add_argument("--tool-latency", type=float, default=0.0, help="bench_lookup工具的延迟（秒）")
+    parser.add_argument("--trace-file", help="把所有span写入该JSON lines文件")
+    parser.add_argument("--save", help="把结果保存为JSON，作为以后的基线")
+    parser.add_argument("--baseline", help="与基线JSON比较，退化超过阈值时返回非零退出码")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="允许的退化比例")
+    args = parser.parse_args()
+
+    exporters = [JsonLinesExporter(args.trace_file)] if args.trace_file else []
+    try:
+        result = run_benchmark(args.turns, args.agents, min(args.tools_per_turn, 5),
+                               args.llm_latency, args.token_latency, args.tool_latency,
+                               exporters=exporters)
+    finally:
+        for exporter in exporters:
+            exporter.close()
+    print_report(result)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_with_baseline(result, json.load(f), args.max_regression)
+        if regressions:
+            print("性能退化：")
+            for item in regressions:
+                print(f"  - {item}")
+            sys.exit(1)
+        print("与基线相比没有明显退化")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+# LLM HTTP后端：连接池、并发限制、抖动退避重试、请求批处理
+import json
+import time
+import queue
+import random
+import threading
+import http.client
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+class LLMRequestError(Exception):
+    """LLM服务返回非200状态码"""
+
+    def __init__(self, status: int, body: str):
+        super().__init__(f"LLM请求失败：HTTP {status} {body}")
+        self.status = status
+        self.body = body
+
+
+def completion_content(body: dict) -> str:
+    """从OpenAI兼容的非流式响应中取出文本（choices[0].message.content）"""
+    return body["choices"][0]["message"].get("content") or ""
+
+def delta_content(event: dict) -> str:
+    """从OpenAI兼容的流式事件中取出增量文本（choices[0].delta.content），没有文本时返回空串"""
+    choices = event.get("choices") or []
+    if not choices:
+        return ""
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+
+class FairSemaphore:
+    """
+    先来先服务的信号量
+    释放时把名额直接交给最早等待的线程，避免刚释放的线程反复抢到名额、其他会话被饿出长尾
+    """
+
+    def __init__(self, value: int):
+        self._value = value
+        self._lock = threading.Lock()
+        self._waiters = deque()
+
+    def acquire(self):
+        with self._lock:
+            if self._value > 0 and not self._waiters:
+                self._value -= 1
+                return
+            waiter = threading.Lock()
+            waiter.acquire()
+            self._waiters.append(waiter)
+        waiter.acquire()
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().release()
+            else:
+                self._value += 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class ConnectionPool:
+    """
+    keep-alive连接池
+    空闲连接后进先出复用，出错的连接直接丢弃
+    """
+
+    def __init__(self, base_url: str, size: int = 8, timeout: float = 30):
+        parsed = urlsplit(base_url)
+        self.scheme = parsed.scheme or "http"
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.base_path = parsed.path.rstrip("/")
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+
+    def acquire(self, fresh: bool = False):
+        """
+        取出一个空闲连接，没有空闲连接或fresh为真时新建
+        返回 (连接, 是否复用的空闲连接)
+        """
+        if not fresh:
+            try:
+                return self._idle.get_nowait(), True
+            except queue.Empty:
+                pass
+        connection_class = (http.client.HTTPSConnection if self.scheme == "https"
+                            else http.client.HTTPConnection)
+        return connection_class(self.host, self.port, timeout=self.timeout), False
+
+    def release(self, conn):
+        """归还连接，池满时关闭"""
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    def discard(self, conn):
+        """丢弃出错或未读完的连接"""
+        conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class RequestBatcher:
+    """
+    请求批处理器
+    把多个会话并发提交的非流式请求在一个短时间窗口内合并成一次批量请求
+    """
+
+    def __init__(self, send_batch, max_batch_size: int = 8, window: float = 0.005,
+                 max_workers: int = 4):
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._thread = threading.Thread(target=self._collect, daemon=True)
+        self._thread.start()
+
+    def submit(self, payload: dict) -> Future:
+        future = Future()
+        self._queue.put((payload, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _collect(self):
+        """收集一批请求后交给线程池发送"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        futures = [future for _, future in batch]
+        try:
+            results = self.send_batch([payload for payload, _ in batch])
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        if len(results) != len(futures):
+            error = ValueError(f"批量响应数量不符：请求{len(futures)}个，返回{len(results)}个")
+            for future in futures[len(results):]:
+                future.set_exception(error)
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
+
+class HTTPBackend:
+    """
+    真实LLM服务的HTTP后端，使用OpenAI兼容的 /v1/chat/completions 接口
+    - keep-alive连接池复用TCP连接
+    - 公平信号量限制同时在途的请求数
+    - 连接错误和429/5xx按指数退避加随机抖动重试，服务端给出Retry-After时按其等待（不超过backoff_cap）
+    - 复用的空闲连接已被服务端关闭时立即换新连接重发，不计入重试次数
+    - 可选批处理：batch_size大于1时合并并发的非流式请求，
+      发往 /v1/batch（{"requests": [...]} -> {"responses": [补全响应...]}），需要服务端支持
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url: str, api_key: str = None, max_concurrency: int = 8,
+                 max_retries: int = 3, backoff_base: float = 0.1, backoff_cap: float = 2.0,
+                 timeout: float = 30, batch_size: int = 1, batch_window: float = 0.005):
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.pool = ConnectionPool(base_url, size=max_concurrency, timeout=timeout)
+        self._slots = FairSemaphore(max_concurrency)
+        self.batcher = None
+        if batch_size > 1:
+            self.batcher = RequestBatcher(self._send_batch, max_batch_size=batch_size,
+                                          window=batch_window, max_workers=max_concurrency)
+
+    def complete(self, payload: dict) -> str:
+        """发送非流式请求，返回完整响应文本"""
+        if self.batcher:
+            return self.batcher.submit(payload).result()
+        return completion_content(self._post_json("/v1/chat/completions", payload))
+
+    def stream(self, payload: dict):
+        """
+        发送流式请求，逐个yield token
+        只在收到响应头之前重试，提前关闭生成器时丢弃未读完的连接
+        """
+        payload = dict(payload, stream=True)
+        with self._slots:
+            conn, response = self._send("/v1/chat/completions", payload)
+            try:
+                for line in response:
+                    line = line.strip()
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[len(b"data:"):].strip()
+                    if data == b"[DONE]":
+                        break
+                    content = delta_content(json.loads(data))
+                    if content:
+                        yield content
+                response.read()
+            except BaseException:
+                self.pool.discard(conn)
+                raise
+            self.pool.release(conn)
+
+    def close(self):
+        if self.batcher:
+            self.batcher.close()
+        self.pool.close()
+
+    def _send_batch(self, payloads):
+        body = self._post_json("/v1/batch", {"requests": payloads})
+        return [completion_content(item) for item in body["responses"]]
+
+    def _post_json(self, path: str, payload: dict) -> dict:
+        with self._slots:
+            conn, response = self._send(path, payload)
+            try:
+                data = response.read()
+            except BaseException:
+                self.pool.discard(conn)
+                raise
+            self.pool.release(conn)
+        return json.loads(data)
+
+    def _send(self, path: str, payload: dict):
+        """
+        发送请求直到拿到200响应头
+        返回 (连接, 响应)，调用方负责读完响应后归还连接
+        """
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+
+        attempt = 0
+        fresh = False
+        while True:
+            conn, reused = self.pool.acquire(fresh)
+            fresh = False
+            retry_after = None
+            try:
+                conn.request("POST", self.pool.base_path + path, body, headers)
+                response = conn.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                self.pool.discard(conn)
+                if reused and isinstance(e, ConnectionError):
+                    # 服务端已关闭空闲的keep-alive连接，请求没有发出，换新连接立即重发
+                    fresh = True
+                    continue
+                error = e
+            else:
+                if response.status == 200:
+                    return conn, response
+                error = LLMRequestError(response.status, response.read().decode("utf-8", "replace"))
+                self.pool.release(conn)
+                if response.status not in self.RETRY_STATUS:
+                    raise error
+                retry_after = self._retry_after(response.getheader("Retry-After"))
+            if attempt >= self.max_retries:
+                raise error
+            time.sleep(self._backoff(attempt) if retry_after is None
+                       else min(retry_after, self.backoff_cap))
+            attempt += 1
+
+    def _backoff(self, attempt: int) -> float:
+        """指数退避加全抖动，避免大量会话同时重试"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _retry_after(value):
+        """解析Retry-After（秒数或HTTP日期），无法解析时返回None"""
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
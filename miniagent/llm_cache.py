@@ -0,0 +1,127 @@
+# LLM响应缓存：按消息内容哈希寻址，内存LRU+TTL，可选SQLite磁盘层
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+class ResponseCache:
+    """
+    LLM响应缓存
+    - 键：模型、消息、采样参数序列化后的SHA-256
+    - 内存层：LRU淘汰 + TTL过期
+    - 磁盘层：可选SQLite文件，多进程共享（WAL模式）
+    - 温度高于max_temperature的请求结果不确定，直接绕过缓存
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600, db_path: str = None,
+                 max_temperature: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.max_temperature = max_temperature
+        self._entries = OrderedDict()  # 键 -> (响应, 过期时间)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "bypasses": 0, "evictions": 0}
+        if db_path:
+            self._db().execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    @staticmethod
+    def make_key(model, messages, temperature, max_tokens) -> str:
+        """对请求内容做稳定哈希，字段顺序不影响结果"""
+        payload = json.dumps(
+            {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+            sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def cacheable(self, temperature) -> bool:
+        """温度过高时结果不确定，不走缓存"""
+        if temperature > self.max_temperature:
+            with self._lock:
+                self.counters["bypasses"] += 1
+            return False
+        return True
+
+    def get(self, key: str):
+        """查找缓存，未命中返回None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return entry[0]
+                del self._entries[key]
+
+        if self.db_path:
+            row = self._db().execute(
+                "SELECT response, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+            if row:
+                self._remember(key, row[0], row[1])
+                with self._lock:
+                    self.counters["disk_hits"] += 1
+                return row[0]
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def put(self, key: str, response: str):
+        expires_at = time.time() + self.ttl
+        self._remember(key, response, expires_at)
+        if self.db_path:
+            db = self._db()
+            with db:
+                db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                           (key, response, expires_at))
+
+    def purge_expired(self):
+        """清理磁盘层中已过期的条目"""
+        if self.db_path:
+            db = self._db()
+            with db:
+                db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            db = self._db()
+            with db:
+                db.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        """命中统计，hit_rate按内存和磁盘命中合计"""
+        with self._lock:
+            stats = dict(self.counters, entries=len(self._entries))
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def _remember(self, key, response, expires_at):
+        """写入内存层，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[key] = (response, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def _db(self):
+        """每个线程一个SQLite连接"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
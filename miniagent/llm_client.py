@@ -1,48 +1,292 @@
 # 精简版LLM客户端
 import re
 import json
+from http_backend import HTTPBackend
+from stub_server import simulate_response
+
+# 工具调用代码块的起止标记
+TOOL_CALL_OPEN = "```tool_call\n"
+TOOL_CALL_CLOSE = "```"
+
+# ToolCallStreamParser扫描JSON的返回值：尚未结束 / 括号不平衡等无法成为合法JSON
+SCAN_PENDING = -1
+SCAN_INVALID = -2
 
 class LLMClient:
-    def __init__(self):
-        self.model = "模拟LLM"
-
-    def chat(self, messages, temperature=0.7, max_tokens=1500):
-        """
-        与LLM进行对话
-        这里是模拟实现，实际项目中需要调用真实的LLM API
-        """
-        # 模拟LLM响应
-        user_message = messages[-1]["content"] if messages else ""
-        
-        # 简单的响应逻辑
-        if "时间" in user_message or "几点" in user_message:
-            return """我需要查询当前时间。
-```tool_call
-{
-    "tool_name": "get_time",
-    "parameters": {}
-}
-```"""
+    def __init__(self, base_url=None, api_key=None, model="模拟LLM", cache=None,
+                 temperature=0.7, **backend_options):
+        """
+        base_url为空时使用本地模拟，否则通过HTTP后端调用真实LLM服务
+        cache: 可选ResponseCache，相同请求直接返回缓存的响应
+        temperature: 调用时未指定温度时使用的默认值，路由等确定性调用可设为0以便命中缓存
+        backend_options透传给HTTPBackend（并发数、重试、批处理等）
+        """
+        self.model = model
+        self.temperature = temperature
+        # 模拟流式输出时每个token的字符数
+        self.chunk_size = 4
+        self.cache = cache
+        self.backend = HTTPBackend(base_url, api_key, **backend_options) if base_url else None
+
+    def chat(self, messages, temperature=None, max_tokens=1500):
+        """
+        与LLM进行对话，返回完整响应
+        """
+        if temperature is None:
+            temperature = self.temperature
+        key = self._cache_key(messages, temperature, max_tokens)
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        if self.backend:
+            response = self.backend.complete(self._payload(messages, temperature, max_tokens))
         else:
-            return f"我收到了你的消息：{user_message}"
+            response = "".join(self._stream(messages, temperature, max_tokens))
+
+        if key:
+            self.cache.put(key, response)
+        return response
+
+    def stream_chat(self, messages, temperature=None, max_tokens=1500):
+        """
+        与LLM进行流式对话，逐个yield token
+        缓存命中时一次性产出完整响应
+        读完的输出写入缓存；调用方在工具调用块闭合后提前停止时，把工具调用补全后写入缓存，
+        其他提前停止的输出不完整，不缓存
+        """
+        if temperature is None:
+            temperature = self.temperature
+        key = self._cache_key(messages, temperature, max_tokens)
+        if not key:
+            yield from self._stream(messages, temperature, max_tokens)
+            return
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        try:
+            for chunk in self._stream(messages, temperature, max_tokens):
+                chunks.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            response = self._complete_tool_call("".join(chunks))
+            if response is not None:
+                self.cache.put(key, response)
+            raise
+        self.cache.put(key, "".join(chunks))
+
+    def close(self):
+        """释放HTTP连接池和批处理线程"""
+        if self.backend:
+            self.backend.close()
+
+    def _stream(self, messages, temperature, max_tokens):
+        """
+        不经过缓存的流式输出
+        未配置base_url时按chunk_size切分模拟响应
+        """
+        if self.backend:
+            yield from self.backend.stream(self._payload(messages, temperature, max_tokens))
+            return
+        response = simulate_response(messages)
+        for i in range(0, len(response), self.chunk_size):
+            yield response[i:i + self.chunk_size]
+
+    @staticmethod
+    def _complete_tool_call(prefix):
+        """
+        输出前缀中已有闭合的工具调用时，返回补上结束标记的完整响应，否则返回None
+        工具调用块之后的文本智能体不会读取，不需要保留
+        """
+        parser = ToolCallStreamParser()
+        parts = []
+        for kind, value in parser.feed(prefix):
+            if kind == "tool_call":
+                body = json.dumps(value, ensure_ascii=False, indent=4)
+                return "".join(parts) + TOOL_CALL_OPEN + body + "\n" + TOOL_CALL_CLOSE
+            parts.append(value)
+        return None
+
+    def _cache_key(self, messages, temperature, max_tokens):
+        """返回缓存键，未启用缓存或需要绕过时返回None"""
+        if self.cache is None or not self.cache.cacheable(temperature):
+            return None
+        return self.cache.make_key(self.model, messages, temperature, max_tokens)
+
+    def _payload(self, messages, temperature, max_tokens):
+        return {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
 
     def extract_tool_call(self, response):
         """
-        从LLM响应中提取工具调用
-        这是智能体工具调用的核心机制
-        """
-        # 查找工具调用代码块
-        pattern = r'```tool_call\n(.*?)\n```'
-        match = re.search(pattern, response, re.DOTALL)
-        
-        if match:
-            tool_call_str = match.group(1).strip()
-            tool_call = json.loads(tool_call_str)
-            return tool_call
+        从完整的LLM响应中提取工具调用
+        与流式解析共用ToolCallStreamParser，无效的工具调用块按普通文本处理，返回None
+        """
+        parser = ToolCallStreamParser()
+        for kind, value in parser.feed(response) + parser.close():
+            if kind == "tool_call":
+                return value
         return None
 
     def remove_tool_call_from_response(self, response):
         """从响应中移除工具调用部分"""
         pattern = r'```tool_call\n.*?\n```'
         cleaned_response = re.sub(pattern, '', response, flags=re.DOTALL)
-        return cleaned_response.strip() 
\ No newline at end of file
+        return cleaned_response.strip()
+
+
+class ToolCallStreamParser:
+    """
+    流式工具调用解析器
+    逐块喂入LLM输出，普通文本立即产出，
+    遇到tool_call代码块时边接收边扫描JSON，对象一闭合就产出工具调用
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.state = "text"  # text: 普通文本 / json: 代码块内 / tail: 等待代码块结束 / raw: 无效代码块按文本输出
+        self._scan_pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk):
+        """
+        喂入一段输出，返回事件列表
+        事件为 ("text", 文本) 或 ("tool_call", 工具调用字典)
+        """
+        self.buffer += chunk
+        events = []
+        while True:
+            if self.state == "text":
+                index = self.buffer.find(TOOL_CALL_OPEN)
+                if index >= 0:
+                    if index:
+                        events.append(("text", self.buffer[:index]))
+                    self.buffer = self.buffer[index + len(TOOL_CALL_OPEN):]
+                    self._start_json()
+                    continue
+                # 保留可能是起始标记前缀的结尾部分，其余文本立即产出
+                keep = self._partial_marker_length(self.buffer, TOOL_CALL_OPEN)
+                text = self.buffer[:len(self.buffer) - keep]
+                if text:
+                    events.append(("text", text))
+                self.buffer = self.buffer[len(self.buffer) - keep:]
+                return events
+            elif self.state == "json":
+                end = self._scan_json()
+                if end == SCAN_PENDING:
+                    return events
+                tool_call = None if end == SCAN_INVALID else self._decode(self.buffer[:end])
+                if tool_call is None:
+                    # JSON无效或不是对象，整个代码块按普通文本输出，不中断流
+                    events.append(("text", TOOL_CALL_OPEN))
+                    self.state = "raw"
+                    continue
+                events.append(("tool_call", tool_call))
+                self.buffer = self.buffer[end:]
+                self.state = "tail"
+            elif self.state == "raw":
+                index = self.buffer.find(TOOL_CALL_CLOSE)
+                if index >= 0:
+                    end = index + len(TOOL_CALL_CLOSE)
+                    events.append(("text", self.buffer[:end]))
+                    self.buffer = self.buffer[end:]
+                    self.state = "text"
+                    continue
+                keep = self._partial_marker_length(self.buffer, TOOL_CALL_CLOSE)
+                text = self.buffer[:len(self.buffer) - keep]
+                if text:
+                    events.append(("text", text))
+                self.buffer = self.buffer[len(self.buffer) - keep:]
+                return events
+            else:
+                index = self.buffer.find(TOOL_CALL_CLOSE)
+                if index < 0:
+                    return events
+                self.buffer = self.buffer[index + len(TOOL_CALL_CLOSE):]
+                self.state = "text"
+
+    def close(self):
+        """输出结束，产出剩余的文本"""
+        events = []
+        if self.state in ("text", "raw") and self.buffer:
+            events.append(("text", self.buffer))
+        elif self.state == "json":
+            # 代码块未闭合，按普通文本处理
+            events.append(("text", TOOL_CALL_OPEN + self.buffer))
+        self.buffer = ""
+        self.state = "text"
+        return events
+
+    def _start_json(self):
+        """进入代码块，重置JSON扫描状态"""
+        self.state = "json"
+        self._scan_pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @staticmethod
+    def _decode(text):
+        """解析工具调用JSON，无效或不是对象时返回None"""
+        try:
+            tool_call = json.loads(text)
+        except ValueError:
+            return None
+        return tool_call if isinstance(tool_call, dict) else None
+
+    def _scan_json(self):
+        """
+        从上次位置继续扫描括号深度（{}和[]都计入）
+        返回JSON值结束位置；尚未结束返回SCAN_PENDING；
+        括号不平衡、字符串内换行或JSON闭合前出现结束标记时返回SCAN_INVALID，后续文本不再被扣留
+        """
+        buffer = self.buffer
+        for i in range(self._scan_pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                elif char == "\n":
+                    return SCAN_INVALID
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    return i + 1
+                if self._depth < 0:
+                    return SCAN_INVALID
+            elif char == TOOL_CALL_CLOSE[0]:
+                if len(buffer) - i < len(TOOL_CALL_CLOSE):
+                    # 可能是结束标记的开头，等待更多输出
+                    self._scan_pos = i
+                    return SCAN_PENDING
+                if buffer.startswith(TOOL_CALL_CLOSE, i):
+                    return SCAN_INVALID
+        self._scan_pos = len(buffer)
+        return SCAN_PENDING
+
+    @staticmethod
+    def _partial_marker_length(text, marker):
+        """返回text结尾与marker开头重合的最大长度"""
+        for length in range(min(len(text), len(marker) - 1), 0, -1):
+            if text.endswith(marker[:length]):
+                return length
+        return 0
@@ -0,0 +1,102 @@
+# 多会话服务器本地压测：模拟大量并发会话，统计会话吞吐和每轮延迟
+import time
+import json
+import asyncio
+import argparse
+import os
+import tempfile
+from load_test import percentile
+from server import AgentServer, build_manager
+from stub_server import start_stub_server
+
+async def run_session(host, port, session_id, turns, latencies, errors):
+    """一个会话：建立连接后依次发送turns轮消息"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for turn in range(turns):
+            # 每三轮问一次时间，触发工具调用
+            message = "现在几点了？" if turn % 3 == 2 else f"你好，这是第{turn}轮"
+            request = {"session": session_id, "message": message}
+            start = time.perf_counter()
+            writer.write(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+            await writer.drain()
+            reply = json.loads(await reader.readline())
+            if "error" in reply:
+                errors.append(reply["error"])
+            else:
+                latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+async def run_load(host, port, sessions, turns, concurrency):
+    """运行sessions个会话，同时最多concurrency个，返回统计结果"""
+    latencies, errors = [], []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def bounded(i):
+        async with slots:
+            try:
+                await run_session(host, port, f"load-{i}", turns, latencies, errors)
+            except (OSError, ValueError) as e:
+                errors.append(str(e))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(bounded(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "sessions": sessions,
+        "turns": len(latencies),
+        "errors": len(errors),
+        "elapsed": elapsed,
+        "sessions_per_sec": sessions / elapsed if elapsed else 0.0,
+        "turns_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+    }
+
+async def main_async(args):
+    server = None
+    stub = None
+    host, port = args.host, args.port
+    if not host:
+        # 未指定服务器时在本进程内启动，LLM延迟大于0时再启动本地桩服务器
+        llm_url = None
+        if args.llm_latency > 0:
+            stub = start_stub_server(latency=args.llm_latency, jitter=args.llm_latency / 4)
+            llm_url = stub.url
+        session_db = os.path.join(tempfile.mkdtemp(prefix="sessions-"), "sessions.db")
+        manager = build_manager(llm_url, session_db=session_db,
+                                idle_timeout=args.idle_timeout, turn_workers=args.turn_workers)
+        server = AgentServer(manager, "127.0.0.1", 0, evict_interval=max(args.idle_timeout, 0.1))
+        await server.start()
+        host, port = server.host, server.port
+
+    try:
+        stats = await run_load(host, port, args.sessions, args.turns, args.concurrency)
+    finally:
+        if server:
+            await server.stop()
+        if stub:
+            stub.shutdown()
+
+    print(f"会话数：{stats['sessions']}  轮次：{stats['turns']}  失败：{stats['errors']}  "
+          f"耗时：{stats['elapsed']:.2f}s")
+    print(f"吞吐：{stats['sessions_per_sec']:.1f} 会话/s  {stats['turns_per_sec']:.1f} 轮/s")
+    print(f"每轮延迟 p50：{stats['p50'] * 1000:.1f}ms  p99：{stats['p99'] * 1000:.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="多会话服务器本地压测")
+    parser.add_argument("--host", help="已启动的服务器地址，不填则在本进程内启动")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--turns", type=int, default=3, help="每个会话的轮数")
+    parser.add_argument("--concurrency", type=int, default=200, help="同时在线的会话数")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="桩服务器延迟（秒），0表示本地模拟")
+    parser.add_argument("--idle-timeout", type=float, default=5, help="会话空闲多少秒后移出内存")
+    parser.add_argument("--turn-workers", type=int, default=64)
+    asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# LLMClient离线压测：对本地桩服务器并发发请求，统计吞吐和尾延迟
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from llm_client import LLMClient
+from stub_server import start_stub_server
+
+def percentile(values, p):
+    """取已排序列表的p分位数"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+def run_load_test(client, requests, concurrency, stream=False):
+    """并发发送requests个请求，返回统计结果"""
+    def one_request(i):
+        messages = [{"role": "user", "content": f"压测消息 {i}"}]
+        start = time.perf_counter()
+        try:
+            if stream:
+                for _ in client.stream_chat(messages):
+                    pass
+            else:
+                client.chat(messages)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one_request, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(r for r in results if r is not None)
+    return {
+        "requests": requests,
+        "errors": requests - len(latencies),
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="LLMClient离线压测")
+    parser.add_argument("--url", help="已启动的服务地址，不填则自动启动本地桩服务器")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32, help="并发会话数")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="客户端在途请求上限")
+    parser.add_argument("--batch-size", type=int, default=1, help="大于1时启用请求批处理")
+    parser.add_argument("--stream", action="store_true", help="使用流式接口")
+    parser.add_argument("--latency", type=float, default=0.05, help="桩服务器基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.02, help="桩服务器随机延迟上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="桩服务器返回503的概率")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if not url:
+        server = start_stub_server(latency=args.latency, jitter=args.jitter,
+                                   error_rate=args.error_rate)
+        url = server.url
+
+    client = LLMClient(base_url=url, max_concurrency=args.max_concurrency,
+                       batch_size=args.batch_size)
+    try:
+        stats = run_load_test(client, args.requests, args.concurrency, stream=args.stream)
+    finally:
+        client.close()
+        if server:
+            server.shutdown()
+
+    print(f"请求数：{stats['requests']}  失败：{stats['errors']}  耗时：{stats['elapsed']:.2f}s")
+    print(f"吞吐：{stats['throughput']:.1f} req/s")
+    print(f"延迟 p50：{stats['p50'] * 1000:.1f}ms  p99：{stats['p99'] * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,34 @@
 # 简单的测试程序
 from agent import Agent
+from memory import Memory
+from piv_jobs import JobManager, register_job_tools
+from session_store import SessionStore
+from tools import ToolManager
 
 def main():
     print("=== 精简版智能体测试 ===")
-    agent = Agent()
+    # 对话记录保存在sessions.db中，重启后自动恢复最近的对话
+    store = SessionStore("sessions.db")
+    # PIV批量分析和渲染作为后台任务运行，对话不会被阻塞
+    jobs = JobManager()
+    tools = ToolManager()
+    register_job_tools(tools, jobs)
+    agent = Agent(memory=Memory(store=store, session_id="main"), tools=tools)
+    if agent.memory.message_count:
+        print(f"已恢复会话，共{agent.memory.message_count}条历史消息")
     
     while True:
         user_input = input("\n用户: ").strip()
         if user_input.lower() in ['quit', 'exit']:
             break
         
-        response = agent.chat(user_input)
-        print(f"助手: {response}")
+        print("助手: ", end="", flush=True)
+        agent.chat(user_input, on_token=lambda text: print(text, end="", flush=True))
+        print()
+
+    jobs.shutdown(wait=False)
+    tools.shutdown(wait=False)
+    store.close()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,9 +1,22 @@
 # 精简版记忆管理
 from typing import List, Dict
 
+# 内存中最多保留的消息条数
+MAX_MESSAGES = 20
+
 class Memory:
-    def __init__(self):
+    def __init__(self, store=None, session_id: str = "default"):
+        """
+        store: 可选SessionStore，传入后每条消息都会持久化，
+        创建时只从存储中恢复最近MAX_MESSAGES条
+        """
         self.conversations: List[Dict] = []
+        self.store = store
+        self.session_id = session_id
+        # 会话累计的消息总数（包括已移出内存的历史）
+        self.message_count = 0
+        if store:
+            self.conversations, self.message_count = store.load_recent(session_id, MAX_MESSAGES)
 
     def add_message(self, role: str, content: str):
         """
@@ -13,10 +26,13 @@ class Memory:
             "role": role,
             "content": content
         })
-        
+        self.message_count += 1
+        if self.store:
+            self.store.append(self.session_id, role, content)
+
         # 如果对话太长，保留最近的20条
-        if len(self.conversations) > 20:
-            self.conversations = self.conversations[-20:]
+        if len(self.conversations) > MAX_MESSAGES:
+            self.conversations = self.conversations[-MAX_MESSAGES:]
 
     def get_context_messages(self) -> List[Dict]:
         """
@@ -28,4 +44,7 @@ class Memory:
 
     def clear(self):
         """清空记忆"""
-        self.conversations = [] 
\ No newline at end of file
+        self.conversations = []
+        self.message_count = 0
+        if self.store:
+            self.store.delete(self.session_id)
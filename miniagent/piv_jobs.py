@@ -0,0 +1,393 @@
+# PIV后台任务：把批量PIV分析和结果渲染作为异步任务暴露给智能体
+import os
+import sys
+import time
+import uuid
+import threading
+import contextvars
+import multiprocessing
+from pathlib import Path
+from contextlib import contextmanager
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from tools import PROCESS_START_METHOD
+
+# PIV工具代码所在目录，可用环境变量PIV_TOOL_DIR覆盖
+PIV_TOOL_DIR = os.environ.get(
+    "PIV_TOOL_DIR",
+    str(Path(__file__).resolve().parent.parent / "cursor 操作" / "python matlab piv"),
+)
+
+# 任务工具可以访问的数据根目录，工具参数中的路径都必须在其中，可用环境变量PIV_DATA_ROOT修改
+PIV_DATA_ROOT = os.environ.get("PIV_DATA_ROOT", os.getcwd())
+
+# 当前轮次所属的会话，多会话服务器在执行每轮对话的线程中设置，任务按会话隔离
+job_owner = contextvars.ContextVar("job_owner", default=None)
+
+@contextmanager
+def owned_by(owner):
+    """在此范围内提交和查询的任务都属于owner"""
+    token = job_owner.set(owner)
+    try:
+        yield
+    finally:
+        job_owner.reset(token)
+
+def resolve_under(root, path) -> Path:
+    """把相对root的路径解析成绝对路径，越出root时抛出ValueError"""
+    root = Path(root).resolve()
+    resolved = (root / path).resolve()
+    if resolved != root and root not in resolved.parents:
+        raise ValueError(f"路径 {path} 不在数据目录 {root} 内")
+    return resolved
+
+def check_pattern(pattern):
+    """文件名模式只能匹配目录内的文件"""
+    if Path(pattern).is_absolute() or ".." in Path(pattern).parts:
+        raise ValueError(f"文件名模式 {pattern} 不能包含绝对路径或..")
+
+def _import_piv_module(name):
+    """按需导入PIV工具模块（依赖MATLAB引擎/matplotlib，缺失时不影响智能体其他功能）"""
+    if PIV_TOOL_DIR not in sys.path:
+        sys.path.insert(0, PIV_TOOL_DIR)
+    return __import__(name)
+
+def file_statistics(txt_file):
+    """
+    统计单个PIV结果文件（x y u v 四列）
+    返回 {"vectors": 总向量数, "valid": 有效向量数, "speed_sum": 速度和, "speed_max": 最大速度}
+    """
+    import numpy as np
+    data = np.loadtxt(txt_file, ndmin=2)
+    if data.shape[1] != 4:
+        raise ValueError(f"{txt_file} 应该包含4列 (x, y, u, v)")
+    u, v = data[:, 2], data[:, 3]
+    speed = np.hypot(u, v)[np.isfinite(u) & np.isfinite(v)]
+    return {
+        "vectors": int(len(data)),
+        "valid": int(len(speed)),
+        "speed_sum": float(speed.sum()),
+        "speed_max": float(speed.max()) if len(speed) else 0.0,
+    }
+
+def format_statistics(stats):
+    """把累计统计格式化成给LLM看的文本"""
+    if not stats["files"]:
+        return "暂无结果文件"
+    mean_speed = stats["speed_sum"] / stats["valid"] if stats["valid"] else 0.0
+    valid_ratio = stats["valid"] / stats["vectors"] * 100 if stats["vectors"] else 0.0
+    return (f"结果文件：{stats['files']}个  向量：{stats['valid']}/{stats['vectors']}有效"
+            f"（{valid_ratio:.1f}%）  平均速度：{mean_speed:.3f}  最大速度：{stats['speed_max']:.3f}")
+
+def summarize_results(result_dir: str, pattern: str = "piv_result_*.txt", data_root: str = None) -> str:
+    """
+    统计目录中所有PIV结果文件
+    模块级函数，注册为进程池工具，大量结果文件的统计不占用智能体线程
+    data_root: 限制result_dir必须在该目录内
+    """
+    if data_root is not None:
+        try:
+            result_dir = str(resolve_under(data_root, result_dir))
+            check_pattern(pattern)
+        except ValueError as e:
+            return f"错误：{e}"
+    files = sorted(Path(result_dir).glob(pattern))
+    if not files:
+        return f"在目录 {result_dir} 中没有找到匹配 '{pattern}' 的文件"
+    stats = _empty_statistics()
+    for txt_file in files:
+        _merge_statistics(stats, file_statistics(txt_file))
+    return format_statistics(stats)
+
+def render_file(result_dir, txt_file, dpi, format):
+    """在子进程中渲染单个结果文件，返回该文件的统计"""
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    visualizer = _import_piv_module("visualize_piv_results").PIVVisualizer(result_dir)
+    if not visualizer.process_single_file(txt_file, dpi=dpi, format=format):
+        raise ValueError(f"无法渲染 {txt_file}")
+    return file_statistics(txt_file)
+
+def _empty_statistics():
+    return {"files": 0, "vectors": 0, "valid": 0, "speed_sum": 0.0, "speed_max": 0.0}
+
+def _merge_statistics(stats, file_stats):
+    stats["files"] += 1
+    stats["vectors"] += file_stats["vectors"]
+    stats["valid"] += file_stats["valid"]
+    stats["speed_sum"] += file_stats["speed_sum"]
+    stats["speed_max"] = max(stats["speed_max"], file_stats["speed_max"])
+
+
+class Job:
+    """一个后台任务的状态和进度"""
+
+    def __init__(self, kind: str, description: str, owner=None):
+        self.job_id = uuid.uuid4().hex[:8]
+        self.owner = owner
+        self.kind = kind
+        self.description = description
+        self.status = "queued"  # queued / running / succeeded / failed / cancelled
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.statistics = _empty_statistics()
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def record(self, file_stats=None, failed=False):
+        """记录完成一项"""
+        with self.lock:
+            self.done += 1
+            if failed:
+                self.failed += 1
+            elif file_stats:
+                _merge_statistics(self.statistics, file_stats)
+
+    def describe(self) -> str:
+        """任务状态、进度、吞吐和预计剩余时间"""
+        with self.lock:
+            text = f"任务 {self.job_id} [{self.kind}] {self.description}\n状态：{self.status}"
+            if self.total:
+                text += f"  进度：{self.done}/{self.total}（{self.done / self.total * 100:.1f}%）"
+            if self.failed:
+                text += f"  失败：{self.failed}"
+            if self.started_at:
+                elapsed = (self.finished_at or time.time()) - self.started_at
+                throughput = self.done / elapsed if elapsed > 0 else 0.0
+                text += f"\n已运行：{elapsed:.0f}秒  吞吐：{throughput:.2f}项/秒"
+                if self.status == "running" and throughput > 0 and self.total:
+                    text += f"  预计剩余：{(self.total - self.done) / throughput:.0f}秒"
+            if self.error:
+                text += f"\n错误：{self.error}"
+            return text
+
+    def describe_header(self) -> str:
+        """一行简要状态"""
+        return f"任务 {self.job_id} [{self.kind}] {self.status}  完成 {self.done}/{self.total}"
+
+    def summary(self) -> str:
+        with self.lock:
+            return f"{self.describe_header()}\n{format_statistics(self.statistics)}"
+
+
+class JobManager:
+    """
+    后台任务管理
+    - 任务在线程池中运行，提交后立即返回任务ID，对话不会被长时间任务阻塞
+    - 渲染任务把每个结果文件分发到进程池，多核并行
+    - 结果统计在任务运行过程中增量累计，查询摘要不需要重新读文件
+    - 任务属于提交时的会话（job_owner），其他会话查不到也取消不了
+    - 所有路径都必须在data_root内，相对路径按data_root解析
+    - 已结束的任务最多保留max_finished_jobs个，提交新任务时清理最早结束的
+    """
+
+    def __init__(self, max_jobs: int = 2, render_workers: int = None, data_root: str = None,
+                 max_finished_jobs: int = 200):
+        self.jobs = {}
+        self.max_finished_jobs = max_finished_jobs
+        self.data_root = Path(data_root or PIV_DATA_ROOT).resolve()
+        self._job_pool = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="job")
+        self._render_workers = render_workers or os.cpu_count()
+        self._render_pool = None
+        self._lock = threading.Lock()
+
+    def submit_piv_batch(self, image_dir: str, output_dir: str = None, max_pairs: int = None,
+                         window_size: int = 64, step_size: int = 32) -> str:
+        """提交批量PIV分析任务"""
+        try:
+            image_dir = resolve_under(self.data_root, image_dir)
+            output_dir = resolve_under(self.data_root, output_dir or image_dir / "piv_results")
+        except ValueError as e:
+            return f"错误：{e}"
+        if not image_dir.is_dir():
+            return f"错误：图像目录不存在 {image_dir}"
+        image_dir, output_dir = str(image_dir), str(output_dir)
+        job = Job("piv_batch", f"{image_dir} -> {output_dir}", job_owner.get())
+        self._submit(job, self._run_piv_batch, image_dir, output_dir, max_pairs,
+                     window_size, step_size)
+        return f"已提交PIV分析任务 {job.job_id}，结果保存到 {output_dir}"
+
+    def submit_render(self, result_dir: str, pattern: str = "piv_result_*.txt",
+                      dpi: int = 300, format: str = "png") -> str:
+        """提交结果渲染任务"""
+        try:
+            result_dir = resolve_under(self.data_root, result_dir)
+            check_pattern(pattern)
+        except ValueError as e:
+            return f"错误：{e}"
+        if not result_dir.is_dir():
+            return f"错误：结果目录不存在 {result_dir}"
+        result_dir = str(result_dir)
+        job = Job("render", f"{result_dir}/{pattern}", job_owner.get())
+        self._submit(job, self._run_render, result_dir, pattern, dpi, format)
+        return f"已提交渲染任务 {job.job_id}"
+
+    def status(self, job_id: str = None) -> str:
+        """查询任务状态，不传任务ID时列出当前会话的全部任务"""
+        if job_id is None:
+            owner = job_owner.get()
+            with self._lock:
+                jobs = [job for job in self.jobs.values() if job.owner == owner]
+            if not jobs:
+                return "当前没有任务"
+            return "\n".join(job.describe_header() for job in jobs)
+        job = self._get_job(job_id)
+        return job.describe() if job else f"错误：未找到任务 {job_id}"
+
+    def summary(self, job_id: str) -> str:
+        job = self._get_job(job_id)
+        return job.summary() if job else f"错误：未找到任务 {job_id}"
+
+    def cancel(self, job_id: str) -> str:
+        job = self._get_job(job_id)
+        if job is None:
+            return f"错误：未找到任务 {job_id}"
+        if job.status in ("succeeded", "failed", "cancelled"):
+            return f"任务 {job_id} 已结束（{job.status}）"
+        job.cancel_event.set()
+        return f"已请求取消任务 {job_id}，当前这一项处理完后停止"
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job.cancel_event.set()
+        self._job_pool.shutdown(wait=wait, cancel_futures=True)
+        if self._render_pool is not None:
+            self._render_pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _get_job(self, job_id: str):
+        """按ID查找当前会话的任务，其他会话的任务视为不存在"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+        return job if job is not None and job.owner == job_owner.get() else None
+
+    def _submit(self, job: Job, target, *args):
+        with self._lock:
+            self._prune()
+            self.jobs[job.job_id] = job
+        self._job_pool.submit(self._run_job, job, target, *args)
+
+    def _prune(self):
+        """清理最早结束的任务，只保留max_finished_jobs个（调用方持有self._lock）"""
+        finished = [job for job in self.jobs.values() if job.finished_at is not None]
+        excess = len(finished) - self.max_finished_jobs
+        if excess > 0:
+            finished.sort(key=lambda job: job.finished_at)
+            for job in finished[:excess]:
+                del self.jobs[job.job_id]
+
+    def _run_job(self, job: Job, target, *args):
+        if job.cancel_event.is_set():
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            target(job, *args)
+            job.status = "cancelled" if job.cancel_event.is_set() else "succeeded"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+
+    def _run_piv_batch(self, job: Job, image_dir, output_dir, max_pairs, window_size, step_size):
+        """每个任务启动自己的MATLAB引擎，逐对分析并增量统计"""
+        analyzer = _import_piv_module("pivlab_no_gui_final").PIVlabNoGUIFinal()
+
+        def on_progress(done, total, output_file):
+            job.total = total
+            if output_file is None:
+                job.record(failed=True)
+                return
+            try:
+                job.record(file_statistics(output_file))
+            except (OSError, ValueError):
+                job.record(failed=True)
+
+        if not analyzer.start_matlab():
+            raise RuntimeError("MATLAB引擎启动失败")
+        try:
+            successful = analyzer.batch_analyze(image_dir, output_dir, max_pairs, window_size, step_size,
+                                                progress_callback=on_progress, cancel_event=job.cancel_event)
+        finally:
+            analyzer.cleanup()
+        # batch_analyze出错时返回0，图像不足2张时返回None，都不能算成功
+        if not successful and not job.cancel_event.is_set():
+            if job.total == 0:
+                raise RuntimeError("没有可分析的图像对（图像少于2张或读取失败）")
+            raise RuntimeError(f"{job.total}对图像全部分析失败")
+
+    def _run_render(self, job: Job, result_dir, pattern, dpi, format):
+        """把每个结果文件分发到进程池渲染"""
+        files = sorted(Path(result_dir).glob(pattern))
+        if not files:
+            raise RuntimeError(f"在目录 {result_dir} 中没有找到匹配 '{pattern}' 的文件")
+        job.total = len(files)
+        pool = self._get_render_pool()
+        futures = [pool.submit(render_file, result_dir, str(f), dpi, format) for f in files]
+        for future in as_completed(futures):
+            if job.cancel_event.is_set():
+                for pending in futures:
+                    pending.cancel()
+                return
+            try:
+                job.record(future.result())
+            except Exception:
+                job.record(failed=True)
+        if job.failed == job.total:
+            raise RuntimeError(f"{job.total}个结果文件全部渲染失败")
+
+    def _get_render_pool(self):
+        with self._lock:
+            if self._render_pool is None:
+                self._render_pool = ProcessPoolExecutor(
+                    max_workers=self._render_workers,
+                    mp_context=multiprocessing.get_context(PROCESS_START_METHOD))
+            return self._render_pool
+
+
+def register_job_tools(tools, jobs: JobManager):
+    """把任务管理功能注册为智能体工具"""
+    tools.register_tool(
+        "submit_piv_batch", jobs.submit_piv_batch,
+        "提交批量PIV分析后台任务，立即返回任务ID。参数：image_dir图像目录（必填），"
+        "output_dir结果目录，max_pairs最多处理的图像对数，window_size窗口大小，step_size步长",
+        {"image_dir": {"type": "string", "required": True}, "output_dir": {"type": "string"},
+         "max_pairs": {"type": "integer"}, "window_size": {"type": "integer"},
+         "step_size": {"type": "integer"}},
+    )
+    tools.register_tool(
+        "submit_piv_render", jobs.submit_render,
+        "提交PIV结果渲染后台任务，把结果文件画成向量场图片。参数：result_dir结果目录（必填），"
+        "pattern文件名模式，dpi分辨率",
+        {"result_dir": {"type": "string", "required": True}, "pattern": {"type": "string"},
+         "dpi": {"type": "integer"}},
+    )
+    tools.register_tool(
+        "job_status", jobs.status,
+        "查询后台任务的状态、进度和吞吐。参数：job_id任务ID，不填则列出全部任务",
+        {"job_id": {"type": "string"}},
+    )
+    tools.register_tool(
+        "job_summary", jobs.summary,
+        "获取后台任务结果的统计摘要（向量数、有效率、平均/最大速度）。参数：job_id任务ID（必填）",
+        {"job_id": {"type": "string", "required": True}},
+    )
+    tools.register_tool(
+        "cancel_job", jobs.cancel,
+        "取消后台任务。参数：job_id任务ID（必填）",
+        {"job_id": {"type": "string", "required": True}},
+    )
+    tools.register_tool(
+        "piv_result_summary", partial(summarize_results, data_root=str(jobs.data_root)),
+        "统计已有PIV结果目录。参数：result_dir结果目录（必填），pattern文件名模式",
+        {"result_dir": {"type": "string", "required": True}, "pattern": {"type": "string"}},
+        timeout=600, mode="process",
+    )
@@ -0,0 +1,237 @@
+# 多会话智能体服务器：共享LLM连接池、响应缓存和工具执行器
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from agent import Agent
+from llm_client import LLMClient
+from llm_cache import ResponseCache
+from memory import Memory
+from piv_jobs import JobManager, owned_by, register_job_tools
+from session_store import SessionStore
+from tools import ToolManager
+
+class Session:
+    """
+    单个会话：独立的Memory和Agent
+    Agent和Memory保存每轮的状态（迭代次数、延迟指标、消息序号），同一会话的轮次必须依次执行
+    """
+
+    def __init__(self, session_id: str, agent: Agent):
+        self.session_id = session_id
+        self.agent = agent
+        self.turn_lock = asyncio.Lock()
+        self.active_turns = 0
+        self.last_active = time.monotonic()
+
+
+class SessionManager:
+    """
+    会话管理
+    - 每个会话只持有自己的Memory，LLMClient和ToolManager在所有会话间共享
+    - 同步的Agent.chat放到共享的线程池执行，不阻塞事件循环
+    - 对话记录实时写入SessionStore，空闲超过idle_timeout的会话直接从内存移除，
+      再次访问时只恢复最近的消息
+    - close()时一并关闭传入的LLMClient、ToolManager、JobManager和SessionStore
+    """
+
+    def __init__(self, llm: LLMClient, tools: ToolManager, store: SessionStore,
+                 idle_timeout: float = 300, max_active_turns: int = 256, turn_workers: int = 64,
+                 jobs: JobManager = None):
+        self.llm = llm
+        self.tools = tools
+        self.store = store
+        self.jobs = jobs
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self._restoring = {}  # 正在恢复的会话：会话ID -> Future
+        self._active_turns = asyncio.Semaphore(max_active_turns)
+        self._turn_pool = ThreadPoolExecutor(max_workers=turn_workers, thread_name_prefix="turn")
+
+    async def get_session(self, session_id: str) -> Session:
+        """取出会话，不在内存中时从存储恢复（同一会话的并发请求只恢复一次）"""
+        session = self.sessions.get(session_id)
+        if session is not None:
+            return session
+        restoring = self._restoring.get(session_id)
+        if restoring is None:
+            restoring = asyncio.ensure_future(self._restore(session_id))
+            self._restoring[session_id] = restoring
+        return await restoring
+
+    async def _restore(self, session_id: str) -> Session:
+        try:
+            # 读数据库放到线程池，不阻塞事件循环
+            memory = await asyncio.get_running_loop().run_in_executor(
+                self._turn_pool, lambda: Memory(store=self.store, session_id=session_id))
+            agent = Agent(llm=self.llm, memory=memory, tools=self.tools)
+            session = Session(session_id, agent)
+            self.sessions[session_id] = session
+            return session
+        finally:
+            del self._restoring[session_id]
+
+    async def chat(self, session_id: str, message: str) -> str:
+        session = await self.get_session(session_id)
+        # 排队等待的轮次也计入，避免会话在排队期间被写盘移除
+        session.active_turns += 1
+        try:
+            # 先按会话排队再占全局名额，同一会话排队的轮次不占用其他会话的名额
+            async with session.turn_lock, self._active_turns:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._turn_pool, self._run_turn, session, message)
+        finally:
+            session.active_turns -= 1
+            session.last_active = time.monotonic()
+
+    @staticmethod
+    def _run_turn(session: Session, message: str) -> str:
+        """在对话线程中执行一轮，期间提交的后台任务归属该会话"""
+        with owned_by(session.session_id):
+            return session.agent.chat(message)
+
+    def evict_idle(self) -> int:
+        """把空闲会话移出内存（记录已经持久化），返回移除的数量"""
+        now = time.monotonic()
+        idle = [session_id for session_id, session in self.sessions.items()
+                if session.active_turns == 0 and now - session.last_active > self.idle_timeout]
+        for session_id in idle:
+            del self.sessions[session_id]
+        return len(idle)
+
+    async def close(self):
+        """等待进行中的轮次结束，关闭共享资源，对话记录全部落盘（阻塞操作不在事件循环上执行）"""
+        await asyncio.get_running_loop().run_in_executor(None, self._shutdown)
+        self.sessions.clear()
+
+    def _shutdown(self):
+        self._turn_pool.shutdown(wait=True)
+        if self.jobs is not None:
+            self.jobs.shutdown()
+        self.tools.shutdown()
+        self.llm.close()
+        self.store.close()
+
+
+class AgentServer:
+    """
+    基于asyncio的TCP服务器，协议为一行一个JSON
+    请求：{"session": "会话ID", "message": "用户输入"}
+    响应：{"session": "会话ID", "response": "回复", "latency": 秒} 或 {"error": "错误信息"}
+    """
+
+    def __init__(self, manager: SessionManager, host: str = "127.0.0.1", port: int = 8766,
+                 evict_interval: float = 30):
+        self.manager = manager
+        self.host = host
+        self.port = port
+        self.evict_interval = evict_interval
+        self._server = None
+        self._evict_task = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port,
+                                                  limit=1 << 20, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._evict_task = asyncio.create_task(self._evict_loop())
+
+    async def stop(self):
+        self._evict_task.cancel()
+        self._server.close()
+        await self._server.wait_closed()
+        await self.manager.close()
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"智能体服务器已启动：{self.host}:{self.port}")
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(self.evict_interval)
+            self.manager.evict_idle()
+
+    async def _handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = await self._handle_request(line)
+                writer.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+            session_id = str(request["session"])
+            message = str(request["message"])
+        except (ValueError, KeyError, TypeError):
+            return {"error": "请求格式错误，需要 {\"session\": ..., \"message\": ...}"}
+
+        start = time.perf_counter()
+        try:
+            response = await self.manager.chat(session_id, message)
+        except Exception as e:
+            return {"session": session_id, "error": str(e)}
+        return {"session": session_id, "response": response,
+                "latency": time.perf_counter() - start}
+
+
+def build_manager(llm_url=None, cache_db=None, cache_max_temperature=0.0,
+                  session_db="sessions.db", temperature=0.7, data_root=None,
+                  **options) -> SessionManager:
+    """
+    创建所有会话共享的LLMClient、响应缓存、ToolManager、后台任务和会话存储
+    temperature不高于cache_max_temperature时响应才会缓存
+    data_root: 后台任务工具可以访问的目录，默认为PIV_DATA_ROOT
+    """
+    cache = ResponseCache(max_entries=10000, db_path=cache_db, max_temperature=cache_max_temperature)
+    llm = LLMClient(base_url=llm_url, cache=cache, temperature=temperature, max_concurrency=64)
+    tools = ToolManager()
+    jobs = JobManager(data_root=data_root)
+    register_job_tools(tools, jobs)
+    return SessionManager(llm, tools, SessionStore(session_db), jobs=jobs, **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多会话智能体服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--llm-url", help="LLM服务地址，不填则使用本地模拟")
+    parser.add_argument("--cache-db", help="响应缓存的SQLite文件，多进程共享")
+    parser.add_argument("--temperature", type=float, default=0.7,
+                        help="LLM采样温度，设为0时相同请求可命中缓存")
+    parser.add_argument("--cache-max-temperature", type=float, default=0.0,
+                        help="温度不高于此值的请求才缓存")
+    parser.add_argument("--session-db", default="sessions.db", help="会话存储的SQLite文件")
+    parser.add_argument("--data-root", help="PIV任务工具可以访问的数据目录，默认为当前目录")
+    parser.add_argument("--idle-timeout", type=float, default=300, help="会话空闲多少秒后移出内存")
+    parser.add_argument("--max-active-turns", type=int, default=256, help="全局同时处理的轮数")
+    parser.add_argument("--turn-workers", type=int, default=64, help="执行对话轮次的线程数")
+    args = parser.parse_args()
+
+    async def run():
+        manager = build_manager(args.llm_url, args.cache_db, args.cache_max_temperature,
+                                session_db=args.session_db, temperature=args.temperature,
+                                data_root=args.data_root,
+                                idle_timeout=args.idle_timeout,
+                                max_active_turns=args.max_active_turns,
+                                turn_workers=args.turn_workers)
+        await AgentServer(manager, args.host, args.port).serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# 会话持久化：SQLite存储对话记录，后台线程分组提交
+import time
+import queue
+import logging
+import sqlite3
+import threading
+from typing import List, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 数据库被锁等暂时性错误时整批重试的次数
+WRITE_RETRIES = 5
+
+class SessionStore:
+    """
+    会话存储
+    - messages表按 (会话ID, 序号) 存每条消息，sessions表是索引，记录消息总数和更新时间
+    - 序号在写事务内由数据库分配（消息总数+1），多个进程写同一会话也不会互相覆盖
+    - 写入先进队列，由后台线程把积压的写操作合并成一个事务提交，不增加每轮对话的延迟
+    - 恢复会话时只等待该会话自己尚未提交的写操作，只读最近的若干条，历史再长也不影响恢复速度
+    - 每个写操作在自己的保存点内执行，出错只丢弃该操作；数据库被锁时整批重试
+      丢弃的写操作记入日志，并累计在failed_writes / last_error中
+    """
+
+    def __init__(self, db_path: str = "sessions.db", batch_size: int = 512):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._pending = {}  # 会话ID -> 尚未提交的写操作数
+        self._pending_changed = threading.Condition()
+        self.failed_writes = 0
+        self.last_error = None
+        db = self._db()
+        with db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, "
+                "content TEXT NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (session_id, seq)) WITHOUT ROWID"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, message_count INTEGER NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def append(self, session_id: str, role: str, content: str):
+        """追加一条消息（异步写入）"""
+        self._enqueue(("append", session_id, role, content, time.time()))
+
+    def delete(self, session_id: str):
+        """删除会话的全部记录（异步写入）"""
+        self._enqueue(("delete", session_id))
+
+    def load_recent(self, session_id: str, limit: int) -> Tuple[List[Dict], int]:
+        """
+        读取会话最近limit条消息和消息总数
+        先等待该会话积压的写操作提交，保证读到自己刚写的内容
+        """
+        with self._pending_changed:
+            self._pending_changed.wait_for(lambda: session_id not in self._pending)
+        db = self._db()
+        row = db.execute("SELECT message_count FROM sessions WHERE session_id = ?",
+                         (session_id,)).fetchone()
+        if row is None:
+            return [], 0
+        rows = db.execute(
+            "SELECT role, content FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, limit),
+        ).fetchall()
+        messages = [{"role": role, "content": content} for role, content in reversed(rows)]
+        return messages, row[0]
+
+    def list_sessions(self) -> List[Tuple[str, int, float]]:
+        """列出所有会话的 (会话ID, 消息总数, 更新时间)，最近更新的在前"""
+        self.flush()
+        return self._db().execute(
+            "SELECT session_id, message_count, updated_at FROM sessions ORDER BY updated_at DESC"
+        ).fetchall()
+
+    def flush(self):
+        """等待所有已提交的写操作落盘"""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+
+    def _enqueue(self, op):
+        with self._pending_changed:
+            self._pending[op[1]] = self._pending.get(op[1], 0) + 1
+        self._queue.put(op)
+
+    def _done(self, batch):
+        """批次提交后减少各会话的待写计数，唤醒等待恢复的线程"""
+        with self._pending_changed:
+            for op in batch:
+                if op is None:
+                    continue
+                count = self._pending[op[1]] - 1
+                if count:
+                    self._pending[op[1]] = count
+                else:
+                    del self._pending[op[1]]
+            self._pending_changed.notify_all()
+
+    def _write_loop(self):
+        # 自动提交模式，事务和保存点由_write_batch显式控制
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            batch = [self._queue.get()]
+            # 分组提交：把队列里已积压的写操作合并到同一个事务
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            try:
+                self._write_batch(db, [op for op in batch if op is not None])
+            finally:
+                self._done(batch)
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                db.close()
+                return
+
+    def _write_batch(self, db, ops):
+        """把一批写操作提交为一个事务"""
+        if not ops:
+            return
+        for attempt in range(WRITE_RETRIES + 1):
+            failures = []
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                for op in ops:
+                    db.execute("SAVEPOINT op")
+                    try:
+                        self._apply(db, op)
+                    except sqlite3.OperationalError:
+                        raise
+                    except sqlite3.Error as e:
+                        # 如主键冲突：只回滚这一个操作，同批其他会话的写入照常提交
+                        db.execute("ROLLBACK TO op")
+                        failures.append((op, e))
+                    db.execute("RELEASE op")
+                db.execute("COMMIT")
+            except sqlite3.OperationalError as e:
+                # 数据库被其他进程锁住等暂时性错误，整批回滚后退避重试
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+                error = e
+                if attempt < WRITE_RETRIES:
+                    time.sleep(min(1.0, 0.05 * 2 ** attempt))
+                continue
+            for op, e in failures:
+                self._record_failure(op, e)
+            return
+        for op in ops:
+            self._record_failure(op, error)
+
+    def _record_failure(self, op, error):
+        logger.error("会话 %s 的%s操作写入失败：%s", op[1], op[0], error)
+        with self._pending_changed:
+            self.failed_writes += 1
+            self.last_error = f"会话 {op[1]} 写入失败：{error}"
+
+    @staticmethod
+    def _apply(db, op):
+        if op[0] == "append":
+            _, session_id, role, content, created_at = op
+            # 序号在同一个写语句里分配，读取和写入都在写锁内完成；
+            # 主键冲突说明记录不一致，抛出错误而不是覆盖已有消息
+            db.execute(
+                "INSERT INTO messages SELECT ?, COALESCE((SELECT message_count FROM sessions "
+                "WHERE session_id = ?), 0) + 1, ?, ?, ?",
+                (session_id, session_id, role, content, created_at),
+            )
+            db.execute(
+                "INSERT INTO sessions VALUES (?, 1, ?) ON CONFLICT(session_id) DO UPDATE SET "
+                "message_count = message_count + 1, updated_at = excluded.updated_at",
+                (session_id, created_at),
+            )
+        elif op[0] == "delete":
+            db.execute("DELETE FROM messages WHERE session_id = ?", (op[1],))
+            db.execute("DELETE FROM sessions WHERE session_id = ?", (op[1],))
+
+    def _db(self):
+        """读操作每个线程一个连接"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
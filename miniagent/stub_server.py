@@ -0,0 +1,190 @@
+# 本地LLM桩服务器：返回模拟响应，用于离线压测LLMClient
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def simulate_response(messages):
+    """
+    模拟LLM响应
+    原LLMClient中的模拟逻辑，本地模式和桩服务器共用
+    """
+    user_message = messages[-1]["content"] if messages else ""
+
+    # 简单的响应逻辑
+    if "时间" in user_message or "几点" in user_message:
+        return """我需要查询当前时间。
+```tool_call
+{
+    "tool_name": "get_time",
+    "parameters": {}
+}
+```"""
+    else:
+        return f"我收到了你的消息：{user_message}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    桩服务器请求处理，响应格式与OpenAI兼容接口一致
+    POST /v1/chat/completions  单个请求，stream为真时按SSE分块返回chat.completion.chunk
+    POST /v1/batch             批量请求 {"requests": [...]} -> {"responses": [chat.completion...]}
+    """
+    protocol_version = "HTTP/1.1"  # 支持keep-alive
+    disable_nagle_algorithm = True  # 响应头和响应体分两次写出，避免与延迟ACK叠加出40ms延迟
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "请求体不是合法JSON"})
+            return
+
+        if random.random() < self.server.error_rate:
+            self._send_json(503, {"error": "模拟服务繁忙"})
+            return
+
+        self._sleep()
+        if self.path == "/v1/chat/completions":
+            if payload.get("stream"):
+                self._send_stream(payload)
+            else:
+                self._send_json(200, self._completion(payload))
+        elif self.path == "/v1/batch":
+            responses = [self._completion(item) for item in payload.get("requests", [])]
+            self._send_json(200, {"responses": responses})
+        else:
+            self._send_json(404, {"error": f"未知路径 {self.path}"})
+
+    def _completion(self, payload):
+        """构造单个补全结果"""
+        content = simulate_response(payload.get("messages", []))
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+        }
+
+    @staticmethod
+    def _chunk(completion_id, model, delta, finish_reason=None):
+        """构造一个流式事件"""
+        return {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    def _sleep(self):
+        """模拟服务端延迟"""
+        latency = self.server.latency + random.uniform(0, self.server.jitter)
+        if latency > 0:
+            time.sleep(latency)
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, payload):
+        """按SSE格式分块返回，每个token一个data事件"""
+        content = simulate_response(payload.get("messages", []))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = payload.get("model", "stub")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._write_event(self._chunk(completion_id, model, {"role": "assistant"}))
+        chunk_size = self.server.chunk_size
+        for i in range(0, len(content), chunk_size):
+            self._write_event(self._chunk(completion_id, model, {"content": content[i:i + chunk_size]}))
+            if self.server.token_latency > 0:
+                time.sleep(self.server.token_latency)
+        self._write_event(self._chunk(completion_id, model, {}, "stop"))
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_event(self, event):
+        self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        """压测时不打印访问日志"""
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # 压测时大量并发建连，默认backlog太小会丢SYN
+
+    def __init__(self, address, latency=0.0, jitter=0.0, token_latency=0.0,
+                 error_rate=0.0, chunk_size=4):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.chunk_size = chunk_size
+
+    def handle_error(self, request, client_address):
+        """客户端提前断开（如智能体检测到工具调用后停止接收）属于正常情况，不打印"""
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_stub_server(host="127.0.0.1", port=0, **options):
+    """在后台线程启动桩服务器，port为0时自动分配端口"""
+    server = StubServer((host, port), **options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地LLM桩服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="每个请求的基础延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.05, help="随机附加延迟上限（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="流式输出每个token的延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回503的概率")
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port), latency=args.latency, jitter=args.jitter,
+                        token_latency=args.token_latency, error_rate=args.error_rate)
+    print(f"桩服务器已启动：{server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,360 @@
 # 精简版工具管理
+import os
+import json
+import time
+import threading
+import contextvars
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import (CancelledError, ProcessPoolExecutor, ThreadPoolExecutor,
+                                TimeoutError as FutureTimeoutError)
 from datetime import datetime
 from typing import Dict, Any
 
+# 参数schema中的类型名 -> Python类型
+PARAMETER_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "array": list,
+    "object": dict,
+}
+
+# 工具执行方式
+EXECUTION_MODES = ("inline", "thread", "process")
+
+# 等待工具结果时检查取消信号的间隔（秒）
+CANCEL_POLL_INTERVAL = 0.05
+
+# 未设置max_concurrency的工具，其专用线程池的线程数
+TOOL_THREAD_WORKERS = 4
+
+# 子进程启动方式：进程里已有大量线程（对话线程池、批处理、SQLite写线程），fork不安全
+PROCESS_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+def invoke_tool(func, parameters, max_result_size):
+    """
+    调用工具函数并限制结果长度
+    进程池模式下在子进程中执行，超长结果在子进程里截断，不会整块传回主进程
+    """
+    result = str(func(**parameters))
+    if max_result_size is not None and len(result) > max_result_size:
+        result = result[:max_result_size] + f"\n...（结果过长已截断，共{len(result)}字符）"
+    return result
+
+def _process_entry(conn, func, parameters, max_result_size):
+    """独立子进程的入口：执行工具，通过管道传回 (是否成功, 结果或错误信息)"""
+    try:
+        conn.send((True, invoke_tool(func, parameters, max_result_size)))
+    except Exception as e:
+        conn.send((False, str(e)))
+    finally:
+        conn.close()
+
+def compile_validator(schema: Dict[str, Dict]):
+    """
+    把参数schema预编译成校验函数
+    schema格式：{"参数名": {"type": "string", "required": True}}
+    校验函数返回错误信息，通过时返回None
+    """
+    checks = []
+    for name, rule in schema.items():
+        expected = PARAMETER_TYPES[rule.get("type", "string")]
+        checks.append((name, expected, rule.get("required", False)))
+    allowed = frozenset(schema)
+
+    def validate(parameters) -> str:
+        if not isinstance(parameters, dict):
+            return "参数必须是JSON对象"
+        unknown = parameters.keys() - allowed
+        if unknown:
+            return f"未知参数 {', '.join(sorted(unknown))}"
+        for name, expected, required in checks:
+            if name not in parameters:
+                if required:
+                    return f"缺少参数 {name}"
+                continue
+            value = parameters[name]
+            # bool是int的子类，数值参数不接受布尔值
+            if not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool):
+                return f"参数 {name} 类型错误"
+        return None
+
+    return validate
+
+
+class ToolSpec:
+    """
+    工具元数据
+    - parameters: 参数schema，注册时预编译成校验函数
+    - cache_ttl: 结果缓存秒数，None表示不缓存（只给纯函数/幂等工具设置）
+    - timeout: 执行超时秒数，None表示不限
+    - max_concurrency: 同时执行的最大数量，None表示不限
+    - mode: 执行方式，inline在调用线程执行（设置了超时则放到线程池），
+      thread放到该工具专用的线程池，process放到进程池（func必须是可pickle的模块级函数），
+      process模式设置了超时或传入cancel_event时改为独立子进程执行，超时或取消时直接终止
+    - max_result_size: 结果最大字符数，超出部分截断，None表示不限
+    """
+
+    def __init__(self, name, func, description="", parameters=None, cache_ttl=None,
+                 timeout=None, max_concurrency=None, mode="inline", max_result_size=10000):
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"未知的执行方式 {mode}")
+        self.name = name
+        self.func = func
+        self.description = description
+        self.parameters = parameters or {}
+        self.cache_ttl = cache_ttl
+        self.timeout = timeout
+        self.mode = mode
+        self.max_result_size = max_result_size
+        self.max_concurrency = max_concurrency
+        self.validate = compile_validator(self.parameters)
+        self.slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        # 专用线程池，第一次使用时创建；超时后仍在运行的调用只占用本工具的线程，不影响其他工具
+        self.executor = None
+        self.stats = {"calls": 0, "errors": 0, "cache_hits": 0, "total_time": 0.0, "max_time": 0.0}
+
+
 class ToolManager:
-    def __init__(self):
-        # 工具注册表：工具名 -> 工具函数
-        self.tools = {
-            "get_time": self.get_time
-        }
+    def __init__(self, cache_size: int = 256, process_pool=None, max_processes: int = None):
+        """
+        process_pool: 可传入共享的进程池，多个ToolManager共用一组进程，未传入时在第一次使用时创建
+        max_processes: 可取消的进程模式工具同时运行的独立子进程数上限，默认为CPU核数
+        线程模式的工具各自使用专用线程池，一个工具卡住不会占满其他工具的线程
+        """
+        # 工具注册表：工具名 -> 工具元数据
+        self.tools: Dict[str, ToolSpec] = {}
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # (工具名, 参数) -> (结果, 过期时间)
+        self._lock = threading.Lock()
+        self._process_pool = process_pool
+        self._owns_process_pool = process_pool is None
+        self._process_slots = threading.BoundedSemaphore(max_processes or os.cpu_count())
+
+        self.register_tool("get_time", self.get_time, description="获取当前时间，无需参数")
+
+    def register_tool(self, name: str, func, description: str = "", parameters=None,
+                      cache_ttl=None, timeout=None, max_concurrency=None, mode="inline",
+                      max_result_size=10000):
+        """注册工具及其执行策略"""
+        self.tools[name] = ToolSpec(name, func, description, parameters, cache_ttl,
+                                    timeout, max_concurrency, mode, max_result_size)
 
-    def execute_tool(self, tool_name: str, parameters: Dict[str, Any]) -> str:
+    def describe_tools(self) -> str:
+        """生成系统提示词中的可用工具列表"""
+        return "\n".join(f"- {spec.name}: {spec.description}" for spec in self.tools.values())
+
+    def execute_tool(self, tool_name: str, parameters: Dict[str, Any], cancel_event=None) -> str:
         """
         执行工具
         这是智能体与外部世界交互的核心机制
+        依次执行参数校验、缓存查找、并发限制和超时控制
+        cancel_event: 可选threading.Event，置位后立即停止等待并返回取消信息
         """
         if tool_name not in self.tools:
             return f"错误：未找到工具 {tool_name}"
-        
-        # 调用对应的工具函数
-        return self.tools[tool_name](**parameters)
+        spec = self.tools[tool_name]
+
+        error = spec.validate(parameters)
+        if error:
+            return f"错误：工具 {tool_name} {error}"
+
+        cache_key = None
+        if spec.cache_ttl is not None:
+            cache_key = (tool_name, json.dumps(parameters, sort_keys=True, ensure_ascii=False))
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                with self._lock:
+                    spec.stats["cache_hits"] += 1
+                return cached
+
+        start = time.perf_counter()
+        result, failed = self._run(spec, parameters, cancel_event)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            spec.stats["calls"] += 1
+            spec.stats["total_time"] += elapsed
+            spec.stats["max_time"] = max(spec.stats["max_time"], elapsed)
+            if failed:
+                spec.stats["errors"] += 1
+        if cache_key and not failed:
+            self._cache_put(cache_key, result, spec.cache_ttl)
+        return result
+
+    def tool_stats(self) -> Dict[str, Dict]:
+        """每个工具的调用次数、错误数、缓存命中数和延迟"""
+        with self._lock:
+            stats = {}
+            for name, spec in self.tools.items():
+                item = dict(spec.stats)
+                item["avg_time"] = item["total_time"] / item["calls"] if item["calls"] else 0.0
+                stats[name] = item
+            return stats
+
+    def shutdown(self, wait: bool = True):
+        """关闭各工具的线程池和自己创建的进程池"""
+        for spec in self.tools.values():
+            if spec.executor is not None:
+                spec.executor.shutdown(wait=wait, cancel_futures=True)
+        if self._owns_process_pool and self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, spec: ToolSpec, parameters: Dict[str, Any], cancel_event=None):
+        """
+        按执行方式、并发限制和超时执行工具，返回 (结果, 是否失败)
+        超时或取消后智能体继续运行：排队中的任务直接撤销，
+        已经开始的任务在后台结束后才归还并发名额
+        等待并发名额和等待结果共用同一个截止时间
+        """
+        deadline = None if spec.timeout is None else time.monotonic() + spec.timeout
+        if spec.slots and not spec.slots.acquire(timeout=spec.timeout):
+            return f"错误：工具 {spec.name} 繁忙，请稍后重试", True
+        if spec.mode == "inline" and spec.timeout is None and cancel_event is None:
+            try:
+                return invoke_tool(spec.func, parameters, spec.max_result_size), False
+            except Exception as e:
+                return f"错误：工具 {spec.name} 执行失败：{e}", True
+            finally:
+                if spec.slots:
+                    spec.slots.release()
+
+        if spec.mode == "process" and (deadline is not None or cancel_event is not None):
+            return self._run_in_process(spec, parameters, deadline, cancel_event)
+        if spec.mode == "process":
+            future = self._get_process_pool().submit(invoke_tool, spec.func, parameters,
+                                                     spec.max_result_size)
+        else:
+            # 在调用方的上下文中执行，工具能读到调用线程设置的contextvars（如任务归属的会话）
+            future = self._get_thread_pool(spec).submit(contextvars.copy_context().run, invoke_tool,
+                                                        spec.func, parameters, spec.max_result_size)
+        if spec.slots:
+            future.add_done_callback(lambda _: spec.slots.release())
+        return self._wait(spec, future, deadline, cancel_event)
+
+    def _wait(self, spec: ToolSpec, future, deadline=None, cancel_event=None):
+        """等待工具结果，同时检查截止时间和取消信号"""
+        while True:
+            try:
+                return future.result(timeout=self._wait_time(deadline, cancel_event)), False
+            except FutureTimeoutError:
+                if cancel_event is not None and cancel_event.is_set():
+                    future.cancel()
+                    return f"错误：工具 {spec.name} 已取消", True
+                if deadline is not None and time.monotonic() >= deadline:
+                    future.cancel()
+                    return f"错误：工具 {spec.name} 执行超时（{spec.timeout}秒）", True
+            except CancelledError:
+                return f"错误：工具 {spec.name} 已取消", True
+            except Exception as e:
+                return f"错误：工具 {spec.name} 执行失败：{e}", True
+
+    def _run_in_process(self, spec: ToolSpec, parameters: Dict[str, Any], deadline=None,
+                        cancel_event=None):
+        """
+        在独立子进程中执行可取消的工具
+        超时或取消时终止子进程，CPU密集的工具不会在后台继续占用进程和并发名额
+        同时存在的子进程数受max_processes限制，名额等待与执行共用截止时间
+        """
+        try:
+            if not self._acquire(self._process_slots, deadline, cancel_event):
+                if cancel_event is not None and cancel_event.is_set():
+                    return f"错误：工具 {spec.name} 已取消", True
+                return f"错误：工具 {spec.name} 繁忙，请稍后重试", True
+            try:
+                return self._run_child(spec, parameters, deadline, cancel_event)
+            finally:
+                self._process_slots.release()
+        finally:
+            if spec.slots:
+                spec.slots.release()
+
+    def _run_child(self, spec: ToolSpec, parameters: Dict[str, Any], deadline, cancel_event):
+        context = multiprocessing.get_context(PROCESS_START_METHOD)
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_process_entry, daemon=True,
+                                  args=(sender, spec.func, parameters, spec.max_result_size))
+        try:
+            process.start()
+        except Exception as e:
+            receiver.close()
+            sender.close()
+            return f"错误：工具 {spec.name} 执行失败：{e}", True
+        sender.close()
+        try:
+            while True:
+                if receiver.poll(self._wait_time(deadline, cancel_event)):
+                    try:
+                        ok, value = receiver.recv()
+                    except EOFError:
+                        return f"错误：工具 {spec.name} 执行失败：子进程异常退出", True
+                    if ok:
+                        return value, False
+                    return f"错误：工具 {spec.name} 执行失败：{value}", True
+                if cancel_event is not None and cancel_event.is_set():
+                    return f"错误：工具 {spec.name} 已取消", True
+                if deadline is not None and time.monotonic() >= deadline:
+                    return f"错误：工具 {spec.name} 执行超时（{spec.timeout}秒）", True
+        finally:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+            receiver.close()
+
+    @classmethod
+    def _acquire(cls, semaphore, deadline=None, cancel_event=None) -> bool:
+        """等待名额直到截止时间或取消，拿到返回True"""
+        while True:
+            if semaphore.acquire(timeout=cls._wait_time(deadline, cancel_event)):
+                return True
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+    @staticmethod
+    def _wait_time(deadline=None, cancel_event=None):
+        """下一次等待的时长：有取消信号时定期检查，有截止时间时不超过剩余时间"""
+        wait_time = CANCEL_POLL_INTERVAL if cancel_event is not None else None
+        if deadline is not None:
+            remaining = max(0, deadline - time.monotonic())
+            wait_time = remaining if wait_time is None else min(wait_time, remaining)
+        return wait_time
+
+    def _get_thread_pool(self, spec: ToolSpec):
+        with self._lock:
+            if spec.executor is None:
+                spec.executor = ThreadPoolExecutor(max_workers=spec.max_concurrency or TOOL_THREAD_WORKERS,
+                                                   thread_name_prefix=f"tool-{spec.name}")
+            return spec.executor
+
+    def _get_process_pool(self):
+        with self._lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=os.cpu_count(),
+                    mp_context=multiprocessing.get_context(PROCESS_START_METHOD))
+            return self._process_pool
+
+    def _cache_get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return entry[0]
+
+    def _cache_put(self, key, result, ttl):
+        with self._lock:
+            self._cache[key] = (result, time.monotonic() + ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
 
     def get_time(self) -> str:
         """
@@ -27,4 +363,4 @@ class ToolManager:
         """
         now = datetime.now()
         weekday = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"][now.weekday()]
-        return f"当前时间：{now.strftime('%Y年%m月%d日 %H:%M:%S')} {weekday}" 
\ No newline at end of file
+        return f"当前时间：{now.strftime('%Y年%m月%d日 %H:%M:%S')} {weekday}"
@@ -0,0 +1,157 @@
+# 链路追踪：记录智能体每轮对话各阶段的耗时、token数和字节数
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+
+class Span:
+    """一个阶段的记录"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.start = time.time()
+        self.duration = 0.0
+
+    def set(self, **attributes):
+        """添加属性，如tokens、bytes"""
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes,
+        }
+
+
+class Tracer:
+    """
+    追踪器
+    span()按线程维护父子关系，同一轮对话的所有阶段共享trace_id
+    结束的span交给所有exporter处理
+    """
+
+    def __init__(self, exporters=None):
+        self.exporters = list(exporters or [])
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        span = Span(name, parent.trace_id if parent else uuid.uuid4().hex,
+                    parent.span_id if parent else None, attributes)
+        stack.append(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - start
+            stack.pop()
+            self._export(span)
+
+    def record(self, name: str, duration: float, **attributes):
+        """直接记录一个已知耗时的阶段（如分散在流式输出中的解析时间）"""
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        span = Span(name, parent.trace_id if parent else uuid.uuid4().hex,
+                    parent.span_id if parent else None, attributes)
+        span.duration = duration
+        self._export(span)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _export(self, span: Span):
+        for exporter in self.exporters:
+            exporter.export(span)
+
+
+class _NullSpan:
+    def set(self, **attributes):
+        pass
+
+
+class NullTracer:
+    """不记录任何内容的追踪器，未开启追踪时使用，几乎没有开销"""
+
+    _span = _NullSpan()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        yield self._span
+
+    def record(self, name: str, duration: float, **attributes):
+        pass
+
+
+class InMemoryCollector:
+    """把span保存在内存中，用于基准测试和调试"""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+    def breakdown(self) -> dict:
+        """
+        按阶段汇总
+        返回 {阶段名: {"count", "total", "mean", "p50", "p99", "tokens", "bytes"}}，时间单位为秒
+        """
+        with self._lock:
+            spans = list(self.spans)
+        groups = {}
+        for span in spans:
+            groups.setdefault(span.name, []).append(span)
+
+        result = {}
+        for name, items in groups.items():
+            durations = sorted(span.duration for span in items)
+            total = sum(durations)
+            result[name] = {
+                "count": len(items),
+                "total": total,
+                "mean": total / len(items),
+                "p50": durations[int(round(0.5 * (len(durations) - 1)))],
+                "p99": durations[int(round(0.99 * (len(durations) - 1)))],
+                "tokens": sum(span.attributes.get("tokens", 0) for span in items),
+                "bytes": sum(span.attributes.get("bytes", 0) for span in items),
+            }
+        return result
+
+
+class JsonLinesExporter:
+    """每个span写一行JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()